@@ -7,6 +7,8 @@ class Agilent34410AMock:
         return 'success'
 
     def query(self, question):
+        if question.startswith('READ?'):
+            return '5.0E-02,5.0E-02,5.0E-02,5.0E-02,5.0E-02'
         answer = '-5'
         return answer
 
@@ -7,6 +7,8 @@ class AgilentN9030AMock:
         return 'success'
 
     def query(self, question):
+        if question.startswith('*ESR?'):
+            return '1'
         answer = '-2'
         return answer
 
@@ -0,0 +1,45 @@
+import asyncio
+import functools
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+DEFAULT_TIMEOUT = 10.0
+
+
+class AsyncInstrument:
+    # awaitable facade over a blocking instr.* driver: driver methods become coroutines,
+    # each instrument gets a single worker so its conversation stays ordered while
+    # different instruments are talked to concurrently
+    def __init__(self, instr, timeout=DEFAULT_TIMEOUT):
+        self._instr = instr
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def __repr__(self):
+        return f'AsyncInstrument({self._instr})'
+
+    def __getattr__(self, name):
+        attr = getattr(self._instr, name)
+        if not callable(attr):
+            return attr
+
+        async def method(*args, timeout=None, **kwargs):
+            return await self.call(name, *args, timeout=timeout, **kwargs)
+        return method
+
+    async def call(self, name, *args, timeout=None, **kwargs):
+        # a cancelled or timed out call stops waiting immediately, the bus transaction
+        # already handed to the driver still completes in the worker
+        loop = asyncio.get_running_loop()
+        fn = functools.partial(getattr(self._instr, name), *args, **kwargs)
+        return await asyncio.wait_for(loop.run_in_executor(self._executor, fn), timeout or self.timeout)
+
+    async def write(self, command, timeout=None):
+        return await self.call('send', command, timeout=timeout)
+
+    async def query(self, question, timeout=None):
+        return await self.call('query', question, timeout=timeout)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
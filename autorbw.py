@@ -0,0 +1,57 @@
+import math
+
+
+# analyzer RBW steps, Hz, widest first
+RBW_STEPS = [1e6, 300e3, 100e3, 30e3, 10e3, 3e3, 1e3, 300.0, 100.0]
+
+
+class RbwControl:
+    # picks the widest RBW and fewest averages that keep the expected tone level snr dB over
+    # the noise floor; the level is extrapolated from the same tone at the previous power step,
+    # or at the previous frequency when this one has just started
+    def __init__(self, offsets, span, danl=-150.0, snr=10.0, max_averages=16):
+        # carriers follow drive 1:1, the third order products 3:1
+        self.carriers = [offset in (0, 1) for offset in offsets]
+        self.slopes = [1.0 if carrier else 3.0 for carrier in self.carriers]
+        self.steps = [rbw for rbw in RBW_STEPS if rbw <= span * 1e6] or RBW_STEPS[-1:]
+        self.danl = danl
+        self.snr = snr
+        self.max_averages = max_averages
+        self._last = dict()
+        self._previous = dict()
+
+    @classmethod
+    def from_plan(cls, plan):
+        return cls(offsets=plan.offsets, span=plan.span, danl=plan.danl, snr=plan.snr, max_averages=plan.averages)
+
+    def noise(self, rbw):
+        return self.danl + 10 * math.log10(rbw)
+
+    def expected(self, freq, tone, pow):
+        last = self._last.get((freq, tone)) or self._previous.get(tone)
+        if last is None:
+            # first reading of the run: carriers come out around the drive level,
+            # nothing is known about the IM3 products yet
+            return pow if self.carriers[tone] else None
+        last_pow, level = last
+        return level + (pow - last_pow) * self.slopes[tone]
+
+    def update(self, freq, tone, pow, level):
+        self._last[freq, tone] = pow, level
+        self._previous[tone] = pow, level
+
+    def choose(self, expected):
+        # nothing to extrapolate from: measure carefully once
+        if expected is None:
+            return self.steps[-1], 1
+
+        for rbw in self.steps:
+            if expected - self.noise(rbw) >= self.snr:
+                return rbw, 1
+
+        # out of RBW: averaging does not lower the noise floor, it only steadies the reading
+        # of a tone that sits too close to it; such tones are flagged through reachable()
+        return self.steps[-1], self.max_averages
+
+    def reachable(self, expected):
+        return expected is None or expected - self.noise(self.steps[-1]) >= self.snr
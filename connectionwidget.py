@@ -1,22 +1,14 @@
-from PyQt5 import uic
-from PyQt5.QtCore import pyqtSlot, pyqtSignal, QRunnable, QThreadPool
+from PyQt5.QtCore import pyqtSlot, pyqtSignal, QThreadPool
 from PyQt5.QtWidgets import QWidget
 
 from instrumentwidget import InstrumentWidget
+from task import run_task
+from uiloader import load_ui
 
-
-class ConnectTask(QRunnable):
-
-    def __init__(self, fn, end, *args, **kwargs):
-        super().__init__()
-        self.fn = fn
-        self.end = end
-        self.args = args
-        self.kwargs = kwargs
-
-    def run(self):
-        self.fn(*self.args, **self.kwargs)
-        self.end()
+try:
+    from ui_connectionwidget import Ui_widgetInstrumentController
+except ImportError:
+    Ui_widgetInstrumentController = None
 
 
 class ConnectionWidget(QWidget):
@@ -26,7 +18,7 @@ class ConnectionWidget(QWidget):
     def __init__(self, parent=None, controller=None):
         super().__init__(parent=parent)
 
-        self._ui = uic.loadUi('connectionwidget.ui', self)
+        self._ui = load_ui(self, Ui_widgetInstrumentController, 'connectionwidget.ui')
         self._controller = controller
         self._threads = QThreadPool()
 
@@ -45,9 +37,9 @@ class ConnectionWidget(QWidget):
     def on_btnConnect_clicked(self):
         print('connect')
 
-        self._threads.start(ConnectTask(self._controller.connect,
-                                        self.connectTaskComplete,
-                                        {k: w.address for k, w in self._widgets.items()}))
+        run_task(self._threads, self._controller.connect,
+                 self.connectTaskComplete,
+                 {k: w.address for k, w in self._widgets.items()})
 
     def connectTaskComplete(self):
         if not self._controller.found:
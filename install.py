@@ -1,3 +1,8 @@
 import subprocess
 
+from PyQt5 import uic
+
+# precompile .ui forms into ui_*.py modules, widgets pick them up instead of parsing XML on startup
+uic.compileUiDir('.', map=lambda py_dir, py_file: (py_dir, f'ui_{py_file}'))
+
 subprocess.run(['pyinstaller', '--onedir', 'measure.py', '--clean'])
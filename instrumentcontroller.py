@@ -1,31 +1,66 @@
 import time
-import visa
+import asyncio
 
-from os.path import isfile
 from collections import defaultdict
 
 from PyQt5.QtCore import QObject, pyqtSlot
 
-# MOCK
-from agilent34410amock import Agilent34410AMock
-from agilente3644amock import AgilentE3644AMock
-from agilentn5183amock import AgilentN5183AMock
-from agilentn9030amock import AgilentN9030AMock
-from instr.agilent34410a import Agilent34410A
-from instr.agilente3644a import AgilentE3644A
-from instr.agilentn5183a import AgilentN5183A
-from instr.agilentn9030a import AgilentN9030A
+from asyncinstr import AsyncInstrument
+from autorbw import RbwControl
+from limitevaluator import LimitEvaluator
+from resultstorage import ResultStorage
+from scpisession import SessionLog
+from sweepspec import compile_plan, load_params
+
+# instrument drivers, pyvisa and mocks are imported on connect to keep startup fast
 # from excel import xlsx_result
 
 
 mock_enabled = True
 
+# SCPI session log, gzipped: replay serves a recorded bench run instead of the mocks,
+# record captures every command, answer and its timing on a real bench
+replay_log = None
+replay_time_scale = 1.0
+record_log = None
+
+# presence check: fast DC current readings, mA
+CHECK_NPLC = 0.02
+CHECK_SAMPLES = 5
+CHECK_FLOOR = 0.1
+# s, lets the supply ramp and DUT inrush die out before a current reading
+CHECK_SETTLE = 0.05
+
+# analyzer single sweep completion, s
+SWEEP_TIMEOUT = 60
+SWEEP_POLL = 0.01
+
+
+_rm = None
+_session = None
+
+
+def _resource_manager():
+    global _rm
+    if _rm is None:
+        import visa
+        _rm = visa.ResourceManager()
+    return _rm
+
+
+def _session_log():
+    global _session
+    if _session is None:
+        _session = SessionLog.load(replay_log) if replay_log else SessionLog()
+    return _session
+
 
 class InstrumentFactory:
     def __init__(self, addr, label):
         self.applicable = None
         self.addr = addr
         self.label = label
+        self.idn = ''
     def find(self):
         # TODO remove applicable instrument when found one if needed more than one instrument of the same type
         # TODO: idea: pass list of applicable instruments to differ from the model of the same type?
@@ -35,6 +70,14 @@ class InstrumentFactory:
         return instr
     def from_address(self):
         raise NotImplementedError()
+    def _open(self):
+        if replay_log:
+            inst = _session_log().replay(self.addr, time_scale=replay_time_scale)
+        else:
+            inst = _resource_manager().open_resource(self.addr)
+            if record_log:
+                inst = _session_log().record(self.addr, inst)
+        return inst, inst.query('*IDN?')
     def try_find(self):
         raise NotImplementedError()
 
@@ -44,14 +87,16 @@ class GeneratorFactory(InstrumentFactory):
         super().__init__(addr=addr, label='Генератор')
         self.applicable = ['N5183A', 'N5181B', 'E4438C', 'E8257D']
     def from_address(self):
-        if mock_enabled:
-            return AgilentN5183A(self.addr, '1,N5183A mock,1', AgilentN5183AMock())
+        from instr.agilentn5183a import AgilentN5183A
+        if mock_enabled and not replay_log:
+            from agilentn5183amock import AgilentN5183AMock
+            self.idn = '1,N5183A mock,1'
+            return AgilentN5183A(self.addr, self.idn, AgilentN5183AMock())
         try:
-            rm = visa.ResourceManager()
-            inst = rm.open_resource(self.addr)
-            idn = inst.query('*IDN?')
+            inst, idn = self._open()
             name = idn.split(',')[1].strip()
             if name in self.applicable:
+                self.idn = idn.strip()
                 return AgilentN5183A(self.addr, idn, inst)
         except Exception as ex:
             print('Generator find error:', ex)
@@ -63,14 +108,16 @@ class AnalyzerFactory(InstrumentFactory):
         super().__init__(addr=addr, label='Анализатор')
         self.applicable = ['N9030A', 'N9041B']
     def from_address(self):
-        if mock_enabled:
-            return AgilentN9030A(self.addr, '1,N9030A mock,1', AgilentN9030AMock())
+        from instr.agilentn9030a import AgilentN9030A
+        if mock_enabled and not replay_log:
+            from agilentn9030amock import AgilentN9030AMock
+            self.idn = '1,N9030A mock,1'
+            return AgilentN9030A(self.addr, self.idn, AgilentN9030AMock())
         try:
-            rm = visa.ResourceManager()
-            inst = rm.open_resource(self.addr)
-            idn = inst.query('*IDN?')
+            inst, idn = self._open()
             name = idn.split(',')[1].strip()
             if name in self.applicable:
+                self.idn = idn.strip()
                 return AgilentN9030A(self.addr, idn, inst)
         except Exception as ex:
             print('Analyzer find error:', ex)
@@ -82,14 +129,16 @@ class MultimeterFactory(InstrumentFactory):
         super().__init__(addr=addr, label='Мультиметр')
         self.applicable = ['34410A']
     def from_address(self):
-        if mock_enabled:
-            return Agilent34410A(self.addr, '1,34410A mock,1', Agilent34410AMock())
+        from instr.agilent34410a import Agilent34410A
+        if mock_enabled and not replay_log:
+            from agilent34410amock import Agilent34410AMock
+            self.idn = '1,34410A mock,1'
+            return Agilent34410A(self.addr, self.idn, Agilent34410AMock())
         try:
-            rm = visa.ResourceManager()
-            inst = rm.open_resource(self.addr)
-            idn = inst.query('*IDN?')
+            inst, idn = self._open()
             name = idn.split(',')[1].strip()
             if name in self.applicable:
+                self.idn = idn.strip()
                 return Agilent34410A(self.addr, idn, inst)
         except Exception as ex:
             print('Multimeter find error:', ex)
@@ -98,17 +147,19 @@ class MultimeterFactory(InstrumentFactory):
 
 class SourceFactory(InstrumentFactory):
     def __init__(self, addr):
-        super().__init__(addr=addr, label='Исчточник питания')
+        super().__init__(addr=addr, label='Источник питания')
         self.applicable = ['E3648A', 'N6700C', 'E3631A']
     def from_address(self):
-        if mock_enabled:
-            return AgilentE3644A(self.addr, '1,E3648A mock,1', AgilentE3644AMock())
+        from instr.agilente3644a import AgilentE3644A
+        if mock_enabled and not replay_log:
+            from agilente3644amock import AgilentE3644AMock
+            self.idn = '1,E3648A mock,1'
+            return AgilentE3644A(self.addr, self.idn, AgilentE3644AMock())
         try:
-            rm = visa.ResourceManager()
-            inst = rm.open_resource(self.addr)
-            idn = inst.query('*IDN?')
+            inst, idn = self._open()
             name = idn.split(',')[1].strip()
             if name in self.applicable:
+                self.idn = idn.strip()
                 return AgilentE3644A(self.addr, idn, inst)
         except Exception as ex:
             print('Source find error:', ex)
@@ -143,13 +194,15 @@ class MeasureResultMock(MeasureResult):
 
 class InstrumentController(QObject):
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, storage_path='./results.db'):
         super().__init__(parent=parent)
 
         self.requiredInstruments = {
             'Генератор 1': GeneratorFactory('GPIB2::19::INSTR'),
             'Генератор 2': GeneratorFactory('GPIB2::20::INSTR'),
             'Анализатор': AnalyzerFactory('GPIB2::18::INSTR'),
+            'Мультиметр': MultimeterFactory('GPIB2::22::INSTR'),
+            'Источник питания': SourceFactory('GPIB2::5::INSTR'),
         }
 
         self.deviceParams = {
@@ -159,7 +212,10 @@ class InstrumentController(QObject):
                 'P1': 15,
                 'P2': 21,
                 'Istat': [None, None, None],
-                'Idyn': [None, None, None]
+                'Idyn': [None, None, None],
+                'OIP3': [None, None, None],
+                'Usrc': 5.0,
+                'Isrc': 0.5
             },
             'Тип 2 (1324УВ12У)': {
                 'F': [1.15, 1.35, 1.75, 1.92, 2.25, 2.54, 2.7, 3, 3.47, 3.86, 4.25],
@@ -167,28 +223,35 @@ class InstrumentController(QObject):
                 'P1': 15,
                 'P2': 21,
                 'Istat': [None, None, None],
-                'Idyn': [None, None, None]
+                'Idyn': [None, None, None],
+                'OIP3': [None, None, None],
+                'Usrc': 5.0,
+                'Isrc': 0.5
             },
         }
 
-        if isfile('./params.ini'):
-            import ast
-            with open('./params.ini', 'rt', encoding='utf-8') as f:
-                raw = ''.join(f.readlines())
-                self.deviceParams = ast.literal_eval(raw)
+        self.deviceParams = load_params('./params.ini', default=self.deviceParams)
 
         self.secondaryParams = {'F': 1.0, 'dF': 0.1, 'Pmin': 10.0, 'Pmax': 20.0, 'dP1': 1.0, 'dP2': 1.0}
 
-        self.span = 0.1
+        self.serial = ''
+        self.abortOnFail = True
 
         self._instruments = dict()
         self.found = False
         self.present = False
         self.hasResult = False
+        self.passed = False
+        self.aborted = False
+        self.rawData = list()
+        self.elapsed = 0.0
+        self.lowSnr = list()
+        self._abort = False
 
         # self.result = MeasureResult() if not mock_enabled \
         #     else MeasureResultMock(self.deviceParams, self.secondaryParams)
         self.result = MeasureResultMock(self.deviceParams, self.secondaryParams)
+        self.storage = ResultStorage(storage_path)
 
     def __str__(self):
         return f'{self._instruments}'
@@ -200,74 +263,279 @@ class InstrumentController(QObject):
         self.found = self._find()
 
     def _find(self):
-        self._instruments = {
+        for instr in self._instruments.values():
+            instr.close()
+        found = {
             k: v.find() for k, v in self.requiredInstruments.items()
         }
-        return all(self._instruments.values())
+        self._instruments = {
+            k: AsyncInstrument(v) for k, v in found.items() if v
+        }
+        return all(found.values())
 
-    def check(self, params):
+    async def check(self, params):
         print(f'call check with {params}')
+        self._abort = False
+        self.present = False
         device, secondary = params
-        self.present = self._check(device, secondary)
+        self.present = await self._check(device, secondary)
         print('sample pass')
 
-    def _check(self, device, secondary):
+    async def _check(self, device, secondary):
         print(f'launch check with {self.deviceParams[device]} {self.secondaryParams}')
-        return self.result.init() and self._runCheck(self.deviceParams[device], self.secondaryParams)
+        return self.result.init() and await self._runCheck(self.deviceParams[device], self.secondaryParams)
 
-    def _runCheck(self, param, secondary):
+    async def _runCheck(self, param, secondary):
         print(f'run check with {param}, {secondary}')
-        return True
 
-    def measure(self, params):
+        gen1 = self._instruments['Генератор 1']
+        gen2 = self._instruments['Генератор 2']
+        src = self._instruments['Источник питания']
+
+        evaluator = LimitEvaluator.from_params(param, names=('Istat', 'Idyn'))
+        # hard bounds when the device has no current mask: nothing drawn means no DUT,
+        # running into the supply current limit means a short
+        i_limit = param.get('Isrc', 0.5) * 1_000
+        i_floor, i_ceil = CHECK_FLOOR, i_limit * 0.95
+
+        # anything but a present DUT (fail, abort, cancel, I/O error) leaves RF and supply off
+        present = False
+        try:
+            await asyncio.gather(
+                gen1.set_output(state='OFF'),
+                gen2.set_output(state='OFF'),
+                self._setupFastCurrent(),
+                src.write(f'APPL {param.get("Usrc", 5.0)},{param.get("Isrc", 0.5)}'),
+            )
+            if self._abort:
+                return False
+            await src.write('OUTP ON')
+            await src.query('*OPC?')
+            await asyncio.sleep(CHECK_SETTLE)
+
+            i_stat = await self._readCurrent()
+            print(f'Istat={i_stat} mA')
+            if not (i_floor < i_stat < i_ceil) or not evaluator.check('Istat', i_stat) or self._abort:
+                return False
+
+            # dynamic current at the first frequency the sweep will actually run
+            freq = compile_plan(param, secondary).steps[0].freq
+            await asyncio.gather(
+                self._setTones(gen1, freq, param['P1']),
+                self._setTones(gen2, freq + secondary['dF'], param['P1']),
+            )
+
+            await asyncio.sleep(CHECK_SETTLE)
+
+            i_dyn = await self._readCurrent()
+            print(f'Idyn={i_dyn} mA')
+            present = (i_floor < i_dyn < i_ceil) and evaluator.check('Idyn', i_dyn) and not self._abort
+            return present
+        finally:
+            if not present:
+                await self._switchOff()
+
+    async def _switchOff(self):
+        # best effort, must not mask the error or cancellation that got us here
+        results = await asyncio.gather(
+            self._instruments['Генератор 1'].set_output(state='OFF'),
+            self._instruments['Генератор 2'].set_output(state='OFF'),
+            self._instruments['Источник питания'].write('OUTP OFF'),
+            return_exceptions=True,
+        )
+        for res in results:
+            if isinstance(res, Exception):
+                print('switch off error:', repr(res))
+
+    async def _setTones(self, gen, freq, pow):
+        await gen.set_freq(value=freq, unit='GHz')
+        await gen.set_pow(value=pow, unit='dBm')
+        await gen.set_output(state='ON')
+
+    async def _setupFastCurrent(self):
+        mult = self._instruments['Мультиметр']
+        await mult.write('CONF:CURR:DC AUTO')
+        await mult.write(f'SENS:CURR:DC:NPLC {CHECK_NPLC}')
+        await mult.write('SENS:CURR:DC:ZERO:AUTO OFF')
+        await mult.write('TRIG:SOUR IMM')
+        await mult.write('TRIG:COUN 1')
+        await mult.write(f'SAMP:COUN {CHECK_SAMPLES}')
+
+    async def _readCurrent(self):
+        raw = await self._instruments['Мультиметр'].query('READ?')
+        values = [abs(float(v)) for v in raw.split(',')]
+        return sum(values) / len(values) * 1_000
+
+    async def measure(self, params):
         print(f'call measure with {params}')
+        self._abort = False
+        self.hasResult = False
         device, secondary = params
-        raw_data = self._measure(device, secondary)
+        if not self.serial:
+            print('measure error: sample serial number is not set')
+            self.hasResult = False
+            return
+
+        if record_log:
+            _session_log().reset()
+
+        start = time.perf_counter()
+        raw_data = await self._measure(device, secondary)
+        self.elapsed = time.perf_counter() - start
+        self.rawData = raw_data
         self.hasResult = bool(raw_data)
 
         if self.hasResult:
+            self._store(device, raw_data)
             self._export_to_xlsx(raw_data)
 
-    def _measure(self, device, secondary):
+        if record_log:
+            _session_log().result = raw_data
+            _session_log().elapsed = self.elapsed
+            _session_log().save(record_log)
+
+    async def _measure(self, device, secondary):
         param = self.deviceParams[device]
         secondary = self.secondaryParams
         print(f'launch measure with {param} {secondary}')
 
-        self._instruments['Генератор 1'].set_modulation(state='OFF')
-        self._instruments['Генератор 2'].set_modulation(state='OFF')
-        self._instruments['Анализатор'].set_autocalibrate(state='OFF')
-        self._instruments['Анализатор'].set_span(value=self.span, unit='MHz')
-        self._instruments['Анализатор'].set_marker_mode(marker=1, mode='POS')
-
-        freqs = [1, 1.1, 1.2, 1.3, 1.4, 1.5, 1.6, 1.7, 1.8, 1.9, 2.0]
-        pows = [param['P1'] + 0.5 * i for i in range(int((secondary['Pmax'] - secondary['Pmin']) / 0.5))]
-        dF = secondary['dF']
+        plan = compile_plan(param, secondary)
+        gen1 = self._instruments['Генератор 1']
+        gen2 = self._instruments['Генератор 2']
+        analyzer = self._instruments['Анализатор']
 
+        rbw = RbwControl.from_plan(plan) if plan.rbw == 'auto' else None
+        evaluator = LimitEvaluator.from_params(param, names=('OIP3', ), abort_on_fail=self.abortOnFail)
+        self.lowSnr = list()
+        self.passed = False
+        resolution = None
         result = list()
-        for freq in freqs:
-            self._instruments['Генератор 1'].set_freq(value=freq, unit='GHz')
-            self._instruments['Генератор 2'].set_freq(value=freq, unit='GHz')
-            for pow in pows:
-                self._instruments['Генератор 1'].set_pow(value=pow + secondary['dP1'], unit='dBm')
-                self._instruments['Генератор 2'].set_pow(value=pow + secondary['dP2'], unit='dBm')
-                temp = list()
-                analyzer_freqs = [freq, freq - dF, freq + dF, freq + 2 * dF]
-                for measure_freq in analyzer_freqs:
-                    self._instruments['Анализатор'].set_measure_center_freq(value=measure_freq, unit='GHz')
-                    temp.append(self._instruments['Анализатор'].read_pow(marker=1))
-                result.append(temp)
+        try:
+            await asyncio.gather(
+                gen1.set_modulation(state='OFF'),
+                gen2.set_modulation(state='OFF'),
+                analyzer.set_autocalibrate(state='OFF'),
+            )
+            await analyzer.set_span(value=plan.span, unit='MHz')
+            await analyzer.set_marker_mode(marker=plan.marker, mode='POS')
+
+            if plan.rbw not in (None, 'auto'):
+                resolution = await self._setResolution(analyzer, (plan.rbw, 1), resolution)
+
+            freq = None
+            for step in plan.steps:
+                if self._abort:
+                    print('measure aborted')
+                    break
+                if step.freq != freq:
+                    freq = step.freq
+                    await asyncio.gather(
+                        gen1.set_freq(value=freq, unit='GHz'),
+                        gen2.set_freq(value=freq + secondary['dF'], unit='GHz'),
+                    )
+                await asyncio.gather(
+                    gen1.set_pow(value=step.pow1, unit='dBm'),
+                    gen2.set_pow(value=step.pow2, unit='dBm'),
+                )
 
+                temp = list()
+                for tone, measure_freq in enumerate(step.analyzer_freqs):
+                    await analyzer.set_measure_center_freq(value=measure_freq, unit='GHz')
+                    if rbw:
+                        expected = rbw.expected(freq, tone, step.pow)
+                        if not rbw.reachable(expected):
+                            self.lowSnr.append((freq, step.pow, tone, expected))
+                        setting = rbw.choose(expected)
+                        resolution = await self._setResolution(analyzer, setting, resolution)
+                    if resolution:
+                        await self._sweep(analyzer)
+                    level = await analyzer.read_pow(marker=plan.marker)
+                    if rbw:
+                        rbw.update(freq, tone, step.pow, level)
+                    temp.append(level)
+                row = [freq, step.pow] + temp
+                result.append(row)
+
+                if not evaluator.add_point(row) and evaluator.should_abort:
+                    print(f'sample fail, abort measure: {evaluator.failures[0]}')
+                    break
+        finally:
+            # fail, abort, cancel or I/O error: leave the DUT unpowered
+            self.aborted = len(result) < len(plan.steps)
+            if self.aborted:
+                await self._switchOff()
+            if resolution:
+                await self._restoreResolution(analyzer)
+
+        if self.lowSnr:
+            print(f'{len(self.lowSnr)} tones below the {plan.snr} dB SNR margin at the narrowest RBW, '
+                  f'first: {self.lowSnr[0]}')
+
+        self.passed = evaluator.passed
+        print(f'measure stats: {evaluator.stats}')
         return result
 
+    async def _setResolution(self, analyzer, setting, current):
+        # only touch the analyzer when the setting actually changes
+        if setting == current:
+            return current
+        rbw, averages = setting
+        if current is None:
+            # under RBW control every read is a triggered single sweep, never a stale trace
+            await analyzer.write(':INIT:CONT OFF')
+        if current is None or rbw != current[0]:
+            await analyzer.write(f':SENS:BAND:RES {rbw:g} Hz')
+        if current is None or averages != current[1]:
+            if averages > 1:
+                await analyzer.write(f':SENS:AVER:COUN {averages}')
+                await analyzer.write(':SENS:AVER:STAT ON')
+            else:
+                await analyzer.write(':SENS:AVER:STAT OFF')
+        return setting
+
+    async def _restoreResolution(self, analyzer):
+        await analyzer.write(':SENS:AVER:STAT OFF')
+        await analyzer.write(':SENS:BAND:RES:AUTO ON')
+        await analyzer.write(':INIT:CONT ON')
+
+    async def _sweep(self, analyzer, timeout=SWEEP_TIMEOUT):
+        # *OPC? would block for the whole (averaged) sweep under the VISA I/O timeout,
+        # so arm *OPC and poll the event status register instead
+        await analyzer.write('*CLS')
+        await analyzer.write(':INIT:IMM')
+        await analyzer.write('*OPC')
+        deadline = time.perf_counter() + timeout
+        while not int(await analyzer.query('*ESR?')) & 1:
+            if time.perf_counter() > deadline:
+                raise asyncio.TimeoutError(f'analyzer sweep did not complete in {timeout} s')
+            await asyncio.sleep(SWEEP_POLL)
+
+    def _store(self, device, result):
+        print('storing result')
+        self.storage.add_run(device=device,
+                             serial=self.serial,
+                             idns={k: v.idn for k, v in self.requiredInstruments.items()},
+                             secondary=self.secondaryParams,
+                             points=result,
+                             passed=self.passed,
+                             aborted=self.aborted)
+
     def _export_to_xlsx(self, result):
         print('exporting result')
         # xslx_result(result)
         # xlsx_result.save('out.xlsx')
 
+    def abort(self):
+        self._abort = True
+
     @pyqtSlot(dict)
     def on_secondary_changed(self, params):
         self.secondaryParams = params
 
+    @pyqtSlot(str)
+    def on_serial_changed(self, value):
+        self.serial = value
+
     @property
     def status(self):
         return [i.status for i in self._instruments.values()]
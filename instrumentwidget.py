@@ -1,13 +1,19 @@
-from PyQt5 import uic
 from PyQt5.QtWidgets import QWidget
 
+from uiloader import load_ui
+
+try:
+    from ui_instrumentwidget import Ui_widgetInstrument
+except ImportError:
+    Ui_widgetInstrument = None
+
 
 class InstrumentWidget(QWidget):
 
     def __init__(self, parent=None, title='stub', addr='stub'):
         super().__init__(parent=parent)
 
-        self._ui = uic.loadUi('instrumentwidget.ui', self)
+        self._ui = load_ui(self, Ui_widgetInstrument, 'instrumentwidget.ui')
 
         self.title = title
         self.address = addr
@@ -0,0 +1,97 @@
+import math
+
+from resultstorage import oip3
+
+
+class RunningStats:
+    # Welford's online mean/variance, no sample history kept
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    @property
+    def std(self):
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def __repr__(self):
+        return f'RunningStats(n={self.count}, mean={self.mean:.3f}, std={self.std:.3f}, min={self.min}, max={self.max})'
+
+
+class LimitEvaluator:
+    # limits follow deviceParams convention: name -> [min, typ, max], None means unbounded;
+    # a {freq: [min, typ, max]} dict gives a per-frequency mask.
+    # A single reading outside the mask may be a noisy marker read: a part definitely fails
+    # after `confirm` consecutive out-of-mask readings of one quantity, and passes only when
+    # the running mean of every (quantity, frequency) group also stays inside its mask.
+    def __init__(self, limits, abort_on_fail=True, confirm=3):
+        self.limits = {k: v for k, v in limits.items() if v is not None}
+        self.abort_on_fail = abort_on_fail
+        self.confirm = confirm
+        self.stats = dict()
+        self.failures = list()
+        self._outside = dict()
+
+    @classmethod
+    def from_params(cls, param, names=('OIP3', 'Istat', 'Idyn'), abort_on_fail=True, confirm=3):
+        return cls({k: param.get(k) for k in names}, abort_on_fail=abort_on_fail, confirm=confirm)
+
+    @property
+    def failed(self):
+        return not self.passed
+
+    @property
+    def passed(self):
+        return not self.failures and all(
+            self._inside(name, freq, stats.mean) for (name, freq), stats in self.stats.items()
+        )
+
+    @property
+    def should_abort(self):
+        return self.abort_on_fail and bool(self.failures)
+
+    def reset(self):
+        self.stats.clear()
+        self.failures.clear()
+        self._outside.clear()
+
+    def mask(self, name, freq=None):
+        limit = self.limits.get(name)
+        if isinstance(limit, dict):
+            limit = limit.get(freq) if freq is not None else None
+        if not limit:
+            return None, None
+        return limit[0], limit[-1]
+
+    def _inside(self, name, freq, value):
+        low, high = self.mask(name, freq)
+        return (low is None or value >= low) and (high is None or value <= high)
+
+    def check(self, name, value, freq=None):
+        if value is None:
+            return True
+        self.stats.setdefault((name, freq), RunningStats()).add(value)
+        ok = self._inside(name, freq, value)
+        if ok:
+            self._outside[name] = 0
+            return True
+        self._outside[name] = self._outside.get(name, 0) + 1
+        if self._outside[name] >= self.confirm:
+            low, high = self.mask(name, freq)
+            self.failures.append((name, freq, value, low, high))
+        return False
+
+    def add_point(self, row):
+        freq, pow, tone1, im3_low, tone2, im3_high = row
+        ok = self.check('OIP3', oip3(tone1, im3_low), freq)
+        return self.check('OIP3', oip3(tone2, im3_high), freq) and ok
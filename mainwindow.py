@@ -1,4 +1,3 @@
-from PyQt5 import uic
 from PyQt5.QtGui import QPixmap
 from PyQt5.QtWidgets import QMainWindow, QFileDialog
 from PyQt5.QtCore import Qt, pyqtSignal, pyqtSlot, QModelIndex
@@ -7,6 +6,12 @@ from instrumentcontroller import InstrumentController
 from connectionwidget import ConnectionWidget
 from measuremodel import MeasureModel
 from measurewidget import MeasureWidgetWithSecondaryParameters
+from uiloader import load_ui
+
+try:
+    from ui_mainwindow import Ui_MainWindow
+except ImportError:
+    Ui_MainWindow = None
 
 
 class MainWindow(QMainWindow):
@@ -22,7 +27,7 @@ class MainWindow(QMainWindow):
         self.setAttribute(Qt.WA_DeleteOnClose)
 
         # create instance variables
-        self._ui = uic.loadUi('mainwindow.ui', self)
+        self._ui = load_ui(self, Ui_MainWindow, 'mainwindow.ui')
         self._instrumentController = InstrumentController(parent=self)
         self._connectionWidget = ConnectionWidget(parent=self, controller=self._instrumentController)
         self._measureWidget = MeasureWidgetWithSecondaryParameters(parent=self, controller=self._instrumentController)
@@ -39,6 +44,7 @@ class MainWindow(QMainWindow):
         self._connectionWidget.connected.connect(self._measureWidget.on_instrumentsConnected)
 
         self._measureWidget.secondaryChanged.connect(self._instrumentController.on_secondary_changed)
+        self._measureWidget.serialChanged.connect(self._instrumentController.on_serial_changed)
 
         self._measureWidget.measureComplete.connect(self._measureModel.update)
 
@@ -1,14 +1,44 @@
 import sys
+import time
 
+start = time.perf_counter()
+
+import asyncio
+
+from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import QApplication
 from mainwindow import MainWindow
 
+try:
+    import qasync
+except ImportError:
+    qasync = None
+
+# seconds from script start to the first event loop iteration
+STARTUP_BUDGET = 2.0
+
+
+def report_startup():
+    elapsed = time.perf_counter() - start
+    print(f'startup took {elapsed:.2f} s')
+    if elapsed > STARTUP_BUDGET:
+        print(f'warning: startup budget of {STARTUP_BUDGET:.2f} s exceeded')
+
 
 def main(args):
     app = QApplication(args)
     window = MainWindow()
     window.show()
-    sys.exit(app.exec_())
+    QTimer.singleShot(0, report_startup)
+
+    if qasync is None:
+        sys.exit(app.exec_())
+
+    # run asyncio on the Qt event loop, instrument conversations then share the GUI thread
+    loop = qasync.QEventLoop(app)
+    asyncio.set_event_loop(loop)
+    with loop:
+        loop.run_forever()
 
 
 if __name__ == '__main__':
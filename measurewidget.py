@@ -1,22 +1,14 @@
-from PyQt5 import uic
-from PyQt5.QtCore import pyqtSlot, pyqtSignal, QRunnable, QThreadPool
-from PyQt5.QtWidgets import QWidget, QComboBox, QLabel, QMessageBox, QDoubleSpinBox
+from PyQt5.QtCore import pyqtSlot, pyqtSignal, QThreadPool
+from PyQt5.QtWidgets import QWidget, QComboBox, QLabel, QMessageBox, QDoubleSpinBox, QLineEdit
 
 from deviceselectwidget import DeviceSelectWidget
+from task import run_task
+from uiloader import load_ui
 
-
-class MeasureTask(QRunnable):
-
-    def __init__(self, fn, end, *args, **kwargs):
-        super().__init__()
-        self.fn = fn
-        self.end = end
-        self.args = args
-        self.kwargs = kwargs
-
-    def run(self):
-        self.fn(*self.args, **self.kwargs)
-        self.end()
+try:
+    from ui_measurewidget import Ui_widgetMeasure
+except ImportError:
+    Ui_widgetMeasure = None
 
 
 class MeasureWidget(QWidget):
@@ -28,9 +20,10 @@ class MeasureWidget(QWidget):
     def __init__(self, parent=None, controller=None):
         super().__init__(parent=parent)
 
-        self._ui = uic.loadUi('measurewidget.ui', self)
+        self._ui = load_ui(self, Ui_widgetMeasure, 'measurewidget.ui')
         self._controller = controller
         self._threads = QThreadPool()
+        self._task = None
 
         self._devices = DeviceSelectWidget(parent=self, params=self._controller.deviceParams)
         self._ui.layParams.insertWidget(0, self._devices)
@@ -41,12 +34,13 @@ class MeasureWidget(QWidget):
     def check(self):
         print('checking...')
         self._modeDuringCheck()
-        self._threads.start(MeasureTask(self._controller.check,
-                                        self.checkTaskComplete,
-                                        self._selectedDevice))
+        self._task = run_task(self._threads, self._controller.check,
+                              self.checkTaskComplete,
+                              self._selectedDevice)
 
     def checkTaskComplete(self):
         print('check complete')
+        self._task = None
         if not self._controller.present:
             print('sample not found')
             # QMessageBox.information(self, 'Ошибка', 'Не удалось найти образец, проверьте подключение')
@@ -60,17 +54,20 @@ class MeasureWidget(QWidget):
     def measure(self):
         print('measuring...')
         self._modeDuringMeasure()
-        self._threads.start(MeasureTask(self._controller.measure,
-                                        self.measureTaskComplete,
-                                        self._selectedDevice))
+        self._task = run_task(self._threads, self._controller.measure,
+                              self.measureTaskComplete,
+                              self._selectedDevice)
 
     def measureTaskComplete(self):
         print('measure complete')
+        self._task = None
         # TODO check if measure completed successfully?
         if not self._controller.hasResult:
             print('error during measurement')
+            self._modePreCheck()
             return
 
+        print('sample pass' if self._controller.passed else 'sample fail')
         self._modePreCheck()
         self.measureComplete.emit()
 
@@ -88,6 +85,18 @@ class MeasureWidget(QWidget):
         print('start measure')
         self.measure()
 
+    @pyqtSlot()
+    def on_btnAbort_clicked(self):
+        print('abort')
+        self.abort()
+
+    def abort(self):
+        # the controller flag stops a sweep running in a pool thread between steps,
+        # a coroutine on the qasync loop is cancelled right away
+        self._controller.abort()
+        if self._task is not None:
+            self._task.cancel()
+
     @pyqtSlot(str)
     def on_selectedChanged(self, value):
         self._selectedDevice = value
@@ -97,30 +106,36 @@ class MeasureWidget(QWidget):
         self._ui.btnCheck.setEnabled(False)
         self._ui.btnMeasure.setEnabled(False)
         self._devices.enabled = True
+        self._ui.btnAbort.setEnabled(False)
 
     def _modePreCheck(self):
         self._ui.btnCheck.setEnabled(True)
         self._ui.btnMeasure.setEnabled(False)
         self._devices.enabled = True
+        self._ui.btnAbort.setEnabled(False)
 
     def _modeDuringCheck(self):
         self._ui.btnCheck.setEnabled(False)
         self._ui.btnMeasure.setEnabled(False)
         self._devices.enabled = False
+        self._ui.btnAbort.setEnabled(True)
 
     def _modePreMeasure(self):
         self._ui.btnCheck.setEnabled(False)
         self._ui.btnMeasure.setEnabled(True)
         self._devices.enabled = False
+        self._ui.btnAbort.setEnabled(False)
 
     def _modeDuringMeasure(self):
         self._ui.btnCheck.setEnabled(False)
         self._ui.btnMeasure.setEnabled(False)
         self._devices.enabled = False
+        self._ui.btnAbort.setEnabled(True)
 
 
 class MeasureWidgetWithSecondaryParameters(MeasureWidget):
     secondaryChanged = pyqtSignal(dict)
+    serialChanged = pyqtSignal(str)
 
     def __init__(self, parent=None, controller=None):
         super().__init__(parent=parent, controller=controller)
@@ -133,6 +148,9 @@ class MeasureWidgetWithSecondaryParameters(MeasureWidget):
         # self._spinFreq.setSingleStep(1)
         # self._devices._layout.addRow('F=', self._spinFreq)   # 0 .. 20k
 
+        self._editSerial = QLineEdit(parent=self)
+        self._devices._layout.addRow('Серийный №', self._editSerial)
+
         self._spinDeltaFreq = QDoubleSpinBox(parent=self)
         self._spinDeltaFreq.setMinimum(0)
         self._spinDeltaFreq.setMaximum(100)
@@ -177,40 +195,49 @@ class MeasureWidgetWithSecondaryParameters(MeasureWidget):
         self._spinPmax.valueChanged.connect(self.on_params_changed)
         self._spinDeltaP1.valueChanged.connect(self.on_params_changed)
         self._spinDeltaP2.valueChanged.connect(self.on_params_changed)
+        self._editSerial.textChanged.connect(self.on_serial_changed)
 
     def _modePreConnect(self):
         super()._modePreConnect()
         # self._spinFreq.setEnabled(True)
+        self._editSerial.setEnabled(True)
 
     def _modePreCheck(self):
         super()._modePreCheck()
         # self._spinFreq.setEnabled(True)
+        self._editSerial.setEnabled(True)
 
     def _modeDuringCheck(self):
         super()._modeDuringCheck()
         # self._spinFreq.setEnabled(False)
+        self._editSerial.setEnabled(False)
 
     def _modePreMeasure(self):
         super()._modePreMeasure()
         # self._spinFreq.setEnabled(False)
+        self._editSerial.setEnabled(False)
 
     def _modeDuringMeasure(self):
         super()._modeDuringMeasure()
         # self._spinFreq.setEnabled(False)
+        self._editSerial.setEnabled(False)
 
     def check(self):
         print('subclass checking...')
+        if not self._editSerial.text().strip():
+            print('enter sample serial number')
+            return
         self._modeDuringCheck()
-        self._threads.start(MeasureTask(self._controller.check,
-                                        self.checkTaskComplete,
-                                        [self._selectedDevice, self._params]))
+        self._task = run_task(self._threads, self._controller.check,
+                              self.checkTaskComplete,
+                              [self._selectedDevice, self._params])
 
     def measure(self):
         print('subclass measuring...')
         self._modeDuringMeasure()
-        self._threads.start(MeasureTask(self._controller.measure,
-                                        self.measureTaskComplete,
-                                        [self._selectedDevice, self._params]))
+        self._task = run_task(self._threads, self._controller.measure,
+                              self.measureTaskComplete,
+                              [self._selectedDevice, self._params])
 
     def on_params_changed(self, value):
         params = {
@@ -222,3 +249,6 @@ class MeasureWidgetWithSecondaryParameters(MeasureWidget):
             'dP2': self._spinDeltaP2.value()
         }
         self.secondaryChanged.emit(params)
+
+    def on_serial_changed(self, value):
+        self.serialChanged.emit(value.strip())
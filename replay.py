@@ -0,0 +1,45 @@
+import sys
+import asyncio
+import argparse
+
+import instrumentcontroller
+
+from instrumentcontroller import InstrumentController
+from scpisession import SessionLog
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Run measure against a recorded SCPI session')
+    parser.add_argument('log', help='session recorded with instrumentcontroller.record_log')
+    parser.add_argument('--device', help='device type, defaults to the first one in params')
+    parser.add_argument('--serial', default='replay', help='sample serial number stored with the run')
+    parser.add_argument('--scale', type=float, default=1.0, help='recorded timing multiplier, 0 to skip waits')
+    ns = parser.parse_args(args)
+
+    instrumentcontroller.replay_log = ns.log
+    instrumentcontroller.replay_time_scale = ns.scale
+
+    controller = InstrumentController(storage_path=':memory:')
+    controller.serial = ns.serial
+    controller.connect({})
+    if not controller.found:
+        print('replay error: not all instruments are present in the log')
+        return 2
+
+    device = ns.device or next(iter(controller.deviceParams))
+    params = [device, controller.secondaryParams]
+    asyncio.run(controller.measure(params))
+
+    recorded = SessionLog.load(ns.log)
+    same = recorded.result == controller.rawData
+    print(f'result: {"identical" if same else "DIFFERENT"}, {len(controller.rawData)} points')
+    print(f'measure: {controller.elapsed:.3f} s replayed at x{ns.scale}', end='')
+    if recorded.elapsed and ns.scale:
+        print(f', recorded {recorded.elapsed:.3f} s, speedup x{recorded.elapsed * ns.scale / controller.elapsed:.2f}')
+    else:
+        print()
+    return 0 if same else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,189 @@
+import json
+import sqlite3
+import datetime
+
+from contextlib import closing
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS run (
+    id INTEGER PRIMARY KEY,
+    device TEXT NOT NULL,
+    serial TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    idns TEXT NOT NULL,
+    secondary TEXT NOT NULL,
+    passed INTEGER,
+    aborted INTEGER NOT NULL DEFAULT 0,
+    point_count INTEGER NOT NULL DEFAULT 0,
+    dF REAL,
+    dP1 REAL,
+    dP2 REAL
+);
+CREATE TABLE IF NOT EXISTS run_idn (
+    run_id INTEGER NOT NULL REFERENCES run(id) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    idn TEXT NOT NULL,
+    PRIMARY KEY (run_id, role)
+);
+CREATE TABLE IF NOT EXISTS point (
+    run_id INTEGER NOT NULL REFERENCES run(id) ON DELETE CASCADE,
+    freq REAL NOT NULL,
+    pow REAL NOT NULL,
+    tone1 REAL,
+    im3_low REAL,
+    tone2 REAL,
+    im3_high REAL,
+    oip3 REAL
+);
+CREATE INDEX IF NOT EXISTS idx_run_device_timestamp ON run(device, timestamp);
+CREATE INDEX IF NOT EXISTS idx_run_serial ON run(serial);
+CREATE INDEX IF NOT EXISTS idx_run_passed ON run(passed);
+CREATE INDEX IF NOT EXISTS idx_run_secondary ON run(dF, dP1, dP2);
+CREATE INDEX IF NOT EXISTS idx_run_idn_idn ON run_idn(idn, run_id);
+CREATE INDEX IF NOT EXISTS idx_point_freq_run ON point(freq, run_id);
+'''
+
+# columns added after the first release, ALTERed into existing databases
+RUN_COLUMNS = {
+    'passed': 'INTEGER',
+    'aborted': 'INTEGER NOT NULL DEFAULT 0',
+    'point_count': 'INTEGER NOT NULL DEFAULT 0',
+    'dF': 'REAL',
+    'dP1': 'REAL',
+    'dP2': 'REAL',
+}
+
+# secondary params copied into run columns so they can be filtered on
+SECONDARY_COLUMNS = ('dF', 'dP1', 'dP2')
+
+
+def oip3(tone, im3):
+    if tone is None or im3 is None:
+        return None
+    return tone + (tone - im3) / 2
+
+
+class ResultStorage:
+    def __init__(self, path='./results.db'):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA foreign_keys=ON')
+        self._migrate()
+
+    def _migrate(self):
+        existing = {row[1] for row in self._conn.execute('PRAGMA table_info(run)')}
+        tables = {row[0] for row in self._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        with self._conn:
+            for name, decl in RUN_COLUMNS.items():
+                if existing and name not in existing:
+                    self._conn.execute(f'ALTER TABLE run ADD COLUMN {name} {decl}')
+        self._conn.executescript(SCHEMA)
+        if not existing:
+            return
+        with self._conn:
+            # backfill the indexed fields of runs stored before they had their own columns
+            runs = self._conn.execute('SELECT id, idns, secondary FROM run').fetchall()
+            if 'dF' not in existing:
+                self._conn.executemany(
+                    'UPDATE run SET dF = ?, dP1 = ?, dP2 = ? WHERE id = ?',
+                    (self._secondary_row(json.loads(sec)) + (i, ) for i, _, sec in runs)
+                )
+            if 'run_idn' not in tables:
+                self._conn.executemany(
+                    'INSERT INTO run_idn (run_id, role, idn) VALUES (?, ?, ?)',
+                    ((i, role, idn) for i, idns, _ in runs for role, idn in json.loads(idns).items() if idn)
+                )
+
+    def close(self):
+        self._conn.close()
+
+    def add_run(self, device, serial, idns, secondary, points, passed=None, aborted=False, timestamp=None):
+        # points: list of [freq, pow, tone1, im3_low, tone2, im3_high] rows as produced by the sweep
+        timestamp = timestamp or datetime.datetime.now()
+        with self._conn:
+            cur = self._conn.execute(
+                'INSERT INTO run (device, serial, timestamp, idns, secondary, passed, aborted, point_count, dF, dP1, dP2) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (device, serial, timestamp.isoformat(timespec='seconds'),
+                 json.dumps(idns, ensure_ascii=False), json.dumps(secondary, sort_keys=True),
+                 None if passed is None else int(passed), int(aborted), len(points)) + self._secondary_row(secondary)
+            )
+            run_id = cur.lastrowid
+            self._conn.executemany(
+                'INSERT INTO run_idn (run_id, role, idn) VALUES (?, ?, ?)',
+                ((run_id, role, idn) for role, idn in idns.items() if idn)
+            )
+            self._conn.executemany(
+                'INSERT INTO point (run_id, freq, pow, tone1, im3_low, tone2, im3_high, oip3) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (self._point_row(run_id, row) for row in points)
+            )
+        return run_id
+
+    @staticmethod
+    def _secondary_row(secondary):
+        return tuple(secondary.get(name) for name in SECONDARY_COLUMNS)
+
+    @staticmethod
+    def _point_row(run_id, row):
+        freq, pow, tone1, im3_low, tone2, im3_high = row
+        levels = [v for v in (oip3(tone1, im3_low), oip3(tone2, im3_high)) if v is not None]
+        return run_id, freq, pow, tone1, im3_low, tone2, im3_high, min(levels) if levels else None
+
+    def runs(self, device=None, serial=None, since=None, until=None, **filters):
+        where, args = self._run_filter(device, serial, since, until, **filters)
+        with closing(self._conn.execute(
+                f'SELECT id, device, serial, timestamp, idns, secondary, passed, aborted, point_count '
+                f'FROM run {where} ORDER BY timestamp', args)) as cur:
+            return [
+                {'id': i, 'device': d, 'serial': s, 'timestamp': t, 'idns': json.loads(idns), 'secondary': json.loads(sec),
+                 'passed': None if p is None else bool(p), 'aborted': bool(a), 'points': n}
+                for i, d, s, t, idns, sec, p, a, n in cur
+            ]
+
+    def points(self, freq, device=None, serial=None, since=None, until=None, column='oip3', tolerance=1e-6,
+               **filters):
+        if column not in ('tone1', 'im3_low', 'tone2', 'im3_high', 'oip3'):
+            raise ValueError(f'unknown result column: {column}')
+        where, args = self._run_filter(device, serial, since, until, **filters)
+        where = f'{where} AND' if where else 'WHERE'
+        query = f'SELECT run.serial, run.timestamp, point.pow, point.{column} ' \
+                f'FROM point JOIN run ON run.id = point.run_id ' \
+                f'{where} point.freq BETWEEN ? AND ? ORDER BY run.timestamp, point.pow'
+        with closing(self._conn.execute(query, args + [freq - tolerance, freq + tolerance])) as cur:
+            return cur.fetchall()
+
+    @staticmethod
+    def _run_filter(device, serial, since, until, idn=None, passed=None, tolerance=1e-6, **secondary):
+        # secondary: dF, dP1, dP2 values, matched within tolerance
+        unknown = secondary.keys() - set(SECONDARY_COLUMNS)
+        if unknown:
+            raise ValueError(f'unknown run filter: {sorted(unknown)}')
+        clauses = list()
+        args = list()
+        if device is not None:
+            clauses.append('run.device = ?')
+            args.append(device)
+        if serial is not None:
+            clauses.append('run.serial = ?')
+            args.append(serial)
+        if since is not None:
+            clauses.append('run.timestamp >= ?')
+            args.append(since.isoformat(timespec='seconds'))
+        if until is not None:
+            clauses.append('run.timestamp < ?')
+            args.append(until.isoformat(timespec='seconds'))
+        if idn is not None:
+            clauses.append('run.id IN (SELECT run_id FROM run_idn WHERE idn = ?)')
+            args.append(idn)
+        if passed is not None:
+            clauses.append('run.passed = ?')
+            args.append(int(passed))
+        for name, value in secondary.items():
+            if value is not None:
+                clauses.append(f'run.{name} BETWEEN ? AND ?')
+                args += [value - tolerance, value + tolerance]
+        return ('WHERE ' + ' AND '.join(clauses)) if clauses else '', args
@@ -0,0 +1,115 @@
+import gzip
+import json
+import time
+
+from collections import defaultdict, deque
+
+
+class ReplayError(LookupError):
+    pass
+
+
+def _setting(command):
+    # 'header value' writes change instrument state, bare commands (*CLS, :INIT:IMM) are actions
+    header, _, value = command.strip().partition(' ')
+    return (header.upper(), value) if value else None
+
+
+class SessionLog:
+    # entries: [addr, op, command, response, duration], op is 'w' for write or 'q' for query
+    def __init__(self, entries=None, result=None, elapsed=None):
+        self.entries = entries if entries is not None else list()
+        self.result = result
+        self.elapsed = elapsed
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            raw = json.load(f)
+        return cls(entries=raw['entries'], result=raw.get('result'), elapsed=raw.get('elapsed'))
+
+    def save(self, path):
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            json.dump({'version': 1, 'entries': self.entries, 'result': self.result, 'elapsed': self.elapsed}, f,
+                      ensure_ascii=False, separators=(',', ':'))
+
+    def reset(self):
+        # a log holds one measure run, the connect time identification is kept for replay
+        self.entries = [e for e in self.entries if e[1] == 'q' and e[2] == '*IDN?']
+        self.result = None
+        self.elapsed = None
+
+    def add(self, addr, op, command, response, duration):
+        self.entries.append([addr, op, command, response, round(duration, 6)])
+
+    def record(self, addr, inst):
+        return RecordingResource(addr, inst, self)
+
+    def replay(self, addr, time_scale=1.0):
+        return ReplayResource(addr, [e for e in self.entries if e[0] == addr], time_scale)
+
+
+class RecordingResource:
+    def __init__(self, addr, inst, log):
+        self._addr = addr
+        self._inst = inst
+        self._log = log
+
+    def __getattr__(self, name):
+        return getattr(self._inst, name)
+
+    def write(self, command):
+        start = time.perf_counter()
+        answer = self._inst.write(command)
+        self._log.add(self._addr, 'w', command, None, time.perf_counter() - start)
+        return answer
+
+    def query(self, question):
+        start = time.perf_counter()
+        answer = self._inst.query(question)
+        self._log.add(self._addr, 'q', question, answer, time.perf_counter() - start)
+        return answer
+
+
+class ReplayResource:
+    # a query answer is keyed on the question and on the settings written to this instrument
+    # before it, so reordered reads or dropped redundant writes still get the answer the bench
+    # gave in that state; a question never asked in that state is a replay desync
+    def __init__(self, addr, entries, time_scale=1.0):
+        self._addr = addr
+        self._time_scale = time_scale
+        self._state = dict()
+        self._writes = defaultdict(deque)
+        self._answers = defaultdict(deque)
+
+        state = dict()
+        for _, op, command, response, duration in entries:
+            if op == 'w':
+                self._writes[command].append(duration)
+                setting = _setting(command)
+                if setting:
+                    state[setting[0]] = setting[1]
+            else:
+                self._answers[command, frozenset(state.items())].append((response, duration))
+
+    def _wait(self, duration):
+        if self._time_scale:
+            time.sleep(duration * self._time_scale)
+
+    def write(self, command):
+        queue = self._writes.get(command)
+        if queue:
+            self._wait(queue.popleft() if len(queue) > 1 else queue[0])
+        setting = _setting(command)
+        if setting:
+            self._state[setting[0]] = setting[1]
+        return len(command)
+
+    def query(self, question):
+        queue = self._answers.get((question, frozenset(self._state.items())))
+        if not queue:
+            raise ReplayError(f'{self._addr}: replay desync, {question!r} was not recorded in state {self._state}')
+        # repeated questions in one state get the recorded answers in order, then the last one again
+        response, duration = queue.popleft() if len(queue) > 1 else queue[0]
+        self._wait(duration)
+        return response
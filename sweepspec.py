@@ -0,0 +1,171 @@
+import ast
+import json
+import math
+import pickle
+import hashlib
+
+from collections import namedtuple
+from os.path import isfile
+
+
+# per-device 'sweep' entry in deviceParams, missing keys fall back to these
+DEFAULT_SPEC = {
+    'F': None,                   # GHz: list, {'start', 'stop', 'step'} or None for the device 'F' list
+    'P': None,                   # dBm: list, range dict or None for Pmin..Pmax in Pstep from the secondary params
+    'Pstep': 0.5,                # dB
+    'offsets': [0, -1, 1, 2],    # analyzer tones in dF from the carrier: tone 1, low IM3, tone 2, high IM3
+    'span': 0.1,                 # MHz
+    'marker': 1,
+    'rbw': None,                 # Hz, 'auto' to pick per tone, None to leave the analyzer setting alone
+    'snr': 10.0,                 # dB over the noise floor required by auto RBW
+    'danl': -150.0,              # dBm/Hz, analyzer displayed average noise level
+    'averages': 16,              # auto RBW trace averages for tones below the SNR margin
+}
+
+# bump when the validated spec layout changes, invalidates params.ini.cache
+SPEC_VERSION = 3
+
+Step = namedtuple('Step', ['freq', 'pow', 'pow1', 'pow2', 'analyzer_freqs'])
+SweepPlan = namedtuple('SweepPlan', ['span', 'marker', 'rbw', 'snr', 'danl', 'averages', 'offsets', 'steps'])
+
+_plans = dict()
+
+
+class SweepSpecError(ValueError):
+    pass
+
+
+def _number(name, value, positive=False):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise SweepSpecError(f'{name}: number expected, got {value!r}')
+    if positive and value <= 0:
+        raise SweepSpecError(f'{name}: positive value expected, got {value!r}')
+    return float(value)
+
+
+def _grid(name, value):
+    if isinstance(value, dict):
+        missing = {'start', 'stop', 'step'} - value.keys()
+        if missing:
+            raise SweepSpecError(f'{name}: range is missing {sorted(missing)}')
+        start = _number(f'{name}.start', value['start'])
+        stop = _number(f'{name}.stop', value['stop'])
+        step = _number(f'{name}.step', value['step'], positive=True)
+        if stop < start:
+            raise SweepSpecError(f'{name}: stop {stop} is less than start {start}')
+        # floor, with some slack for float steps, so the grid never passes stop
+        count = int(math.floor((stop - start) / step + 1e-9)) + 1
+        return [round(start + step * i, 9) for i in range(count)]
+    if isinstance(value, (list, tuple)):
+        if not value:
+            raise SweepSpecError(f'{name}: empty list')
+        return [_number(f'{name}[{i}]', v) for i, v in enumerate(value)]
+    raise SweepSpecError(f'{name}: list or range expected, got {value!r}')
+
+
+def _integer(name, value, positive=False):
+    number = _number(name, value, positive=positive)
+    if not number.is_integer():
+        raise SweepSpecError(f'{name}: integer expected, got {value!r}')
+    return int(number)
+
+
+def validate(param):
+    sweep = param.get('sweep', dict())
+    if not isinstance(sweep, dict):
+        raise SweepSpecError(f'sweep: dict expected, got {sweep!r}')
+    spec = dict(DEFAULT_SPEC)
+    spec.update(sweep)
+
+    unknown = spec.keys() - DEFAULT_SPEC.keys()
+    if unknown:
+        raise SweepSpecError(f'unknown sweep keys: {sorted(unknown)}')
+
+    return {
+        'F': _grid('F', spec['F'] if spec['F'] is not None else param.get('F')),
+        'P': _grid('P', spec['P']) if spec['P'] is not None else None,
+        'Pstep': _number('Pstep', spec['Pstep'], positive=True),
+        'offsets': _offsets(spec['offsets']),
+        'span': _number('span', spec['span'], positive=True),
+        'marker': _integer('marker', spec['marker'], positive=True),
+        'rbw': _rbw(spec['rbw']),
+        'snr': _number('snr', spec['snr']),
+        'danl': _number('danl', spec['danl']),
+        'averages': _integer('averages', spec['averages'], positive=True),
+    }
+
+
+def _offsets(value):
+    # results, limits and storage expect the four readings in DEFAULT_SPEC order
+    offsets = _grid('offsets', value)
+    if len(offsets) != len(DEFAULT_SPEC['offsets']):
+        raise SweepSpecError(f'offsets: exactly {len(DEFAULT_SPEC["offsets"])} tones expected, got {len(offsets)}')
+    return offsets
+
+
+def _rbw(value):
+    if value is None or value == 'auto':
+        return value
+    return _number('rbw', value, positive=True)
+
+
+def load_params(path, default):
+    # params.ini is parsed and validated once per content, later runs unpickle the cached result
+    if not isfile(path):
+        return validate_params(default)
+
+    with open(path, 'rb') as f:
+        raw = f.read()
+    digest = hashlib.sha1(raw + f'#{SPEC_VERSION}'.encode()).hexdigest()
+    cache = f'{path}.cache'
+
+    if isfile(cache):
+        try:
+            with open(cache, 'rb') as f:
+                cached_digest, params = pickle.load(f)
+            if cached_digest == digest:
+                return params
+        except Exception as ex:
+            print('params cache error:', ex)
+
+    params = validate_params(ast.literal_eval(raw.decode('utf-8')))
+    try:
+        with open(cache, 'wb') as f:
+            pickle.dump((digest, params), f, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError as ex:
+        print('params cache error:', ex)
+    return params
+
+
+def validate_params(params):
+    for device, param in params.items():
+        try:
+            param['sweep'] = validate(param)
+        except SweepSpecError as ex:
+            raise SweepSpecError(f'{device}: {ex}') from ex
+    return params
+
+
+def compile_plan(param, secondary):
+    spec = param['sweep']
+    key = hashlib.sha1(json.dumps([spec, secondary], sort_keys=True).encode()).hexdigest()
+    plan = _plans.get(key)
+    if plan is not None:
+        return plan
+
+    if spec['P'] is not None:
+        pows = spec['P']
+    else:
+        pows = _grid('P', {'start': secondary['Pmin'], 'stop': secondary['Pmax'], 'step': spec['Pstep']})
+
+    dF = secondary['dF']
+    steps = tuple(
+        Step(freq, pow, pow + secondary['dP1'], pow + secondary['dP2'],
+             tuple(round(freq + offset * dF, 9) for offset in spec['offsets']))
+        for freq in spec['F']
+        for pow in pows
+    )
+    plan = SweepPlan(span=spec['span'], marker=spec['marker'], rbw=spec['rbw'], snr=spec['snr'], danl=spec['danl'],
+                     averages=spec['averages'], offsets=tuple(spec['offsets']), steps=steps)
+    _plans[key] = plan
+    return plan
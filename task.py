@@ -0,0 +1,45 @@
+import asyncio
+import inspect
+
+from PyQt5.QtCore import QRunnable
+
+
+class Task(QRunnable):
+
+    def __init__(self, fn, end, *args, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.end = end
+        self.args = args
+        self.kwargs = kwargs
+
+    def run(self):
+        try:
+            self.fn(*self.args, **self.kwargs)
+        except Exception as ex:
+            print('task error:', repr(ex))
+        finally:
+            self.end()
+
+
+def run_task(threads, fn, end, *args):
+    # coroutines run on the Qt event loop when it is driven by qasync,
+    # otherwise they get a private loop in a pool thread as plain callables do
+    if not inspect.iscoroutinefunction(fn):
+        threads.start(Task(fn, end, *args))
+        return None
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        threads.start(Task(lambda *a: asyncio.run(fn(*a)), end, *args))
+        return None
+
+    def done(future):
+        if not future.cancelled() and future.exception():
+            print('task error:', repr(future.exception()))
+        end()
+
+    task = asyncio.ensure_future(fn(*args))
+    task.add_done_callback(done)
+    return task
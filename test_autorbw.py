@@ -0,0 +1,46 @@
+from autorbw import RbwControl
+
+
+def control():
+    return RbwControl(offsets=[0, -1, 1, 2], span=0.1, danl=-150.0, snr=10.0, max_averages=16)
+
+
+def test_rbw_steps_limited_by_span():
+    assert max(control().steps) == 100e3
+
+
+def test_strong_tone_gets_widest_rbw():
+    assert control().choose(-10.0) == (100e3, 1)
+
+
+def test_weak_tone_gets_narrower_rbw():
+    # 30 kHz floor is -105.2 dBm, 10 kHz is -110 dBm
+    assert control().choose(-97.0) == (10e3, 1)
+
+
+def test_unreachable_tone_is_flagged_and_averaged():
+    rbw = control()
+    assert not rbw.reachable(-135.0)
+    assert rbw.choose(-135.0) == (100.0, 16)
+    assert rbw.reachable(-100.0)
+
+
+def test_unknown_level_uses_narrowest_rbw():
+    assert control().choose(None) == (100.0, 1)
+
+
+def test_expected_from_previous_power_step():
+    rbw = control()
+    rbw.update(1.0, 0, 15.0, 10.0)
+    rbw.update(1.0, 1, 15.0, -60.0)
+    assert rbw.expected(1.0, 0, 16.0) == 11.0
+    assert rbw.expected(1.0, 1, 16.0) == -57.0
+
+
+def test_expected_seeded_from_previous_frequency_or_drive():
+    rbw = control()
+    assert rbw.expected(1.0, 0, 15.0) == 15.0
+    assert rbw.expected(1.0, 1, 15.0) is None
+
+    rbw.update(1.0, 1, 20.0, -60.0)
+    assert rbw.expected(2.0, 1, 15.0) == -75.0
@@ -0,0 +1,67 @@
+import math
+
+from limitevaluator import LimitEvaluator, RunningStats
+
+
+def row(freq, oip3_value):
+    # tone at 0 dBm, IM3 chosen so that both sides give the wanted OIP3
+    im3 = -2 * oip3_value
+    return [freq, 0.0, 0.0, im3, 0.0, im3]
+
+
+def test_running_stats_match_batch():
+    values = [1.0, 2.0, 4.0, 7.0]
+    stats = RunningStats()
+    for v in values:
+        stats.add(v)
+    mean = sum(values) / len(values)
+    std = math.sqrt(sum((v - mean) ** 2 for v in values) / (len(values) - 1))
+    assert stats.count == 4
+    assert math.isclose(stats.mean, mean)
+    assert math.isclose(stats.std, std)
+    assert (stats.min, stats.max) == (1.0, 7.0)
+
+
+def test_no_limits_always_pass():
+    evaluator = LimitEvaluator({'OIP3': None})
+    assert evaluator.add_point(row(1.0, -100.0))
+    assert evaluator.passed
+
+
+def test_single_outlier_does_not_abort():
+    evaluator = LimitEvaluator({'OIP3': [20, None, None]}, confirm=3)
+    for value in [25.0, 25.0, 10.0, 25.0, 25.0, 25.0]:
+        evaluator.add_point(row(1.0, value))
+    assert not evaluator.should_abort
+    assert evaluator.passed
+
+
+def test_consecutive_outliers_abort():
+    evaluator = LimitEvaluator({'OIP3': [20, None, None]}, confirm=3)
+    assert not evaluator.add_point(row(1.0, 10.0))
+    assert not evaluator.should_abort
+    evaluator.add_point(row(1.0, 10.0))
+    assert evaluator.should_abort
+    assert evaluator.failed
+
+
+def test_mean_outside_mask_fails_without_abort():
+    evaluator = LimitEvaluator({'OIP3': [20, None, None]}, confirm=3)
+    for value in [21.0, 10.0, 21.0, 10.0]:
+        evaluator.check('OIP3', value, 1.0)
+    assert not evaluator.should_abort
+    assert not evaluator.passed
+
+
+def test_per_frequency_mask():
+    evaluator = LimitEvaluator({'OIP3': {1.0: [30, None, None], 2.0: [10, None, None]}}, confirm=1)
+    assert evaluator.add_point(row(2.0, 20.0))
+    assert not evaluator.add_point(row(1.0, 20.0))
+    assert evaluator.failures[0][:2] == ('OIP3', 1.0)
+
+
+def test_abort_disabled():
+    evaluator = LimitEvaluator({'Istat': [1, None, 5]}, abort_on_fail=False, confirm=1)
+    assert not evaluator.check('Istat', 10.0)
+    assert not evaluator.should_abort
+    assert evaluator.failed
@@ -0,0 +1,105 @@
+import json
+import sqlite3
+import datetime
+
+import pytest
+
+from resultstorage import ResultStorage, oip3
+
+
+IDNS = {'Генератор 1': 'Agilent,E8257D,1', 'Анализатор': 'Agilent,N9030A,1', 'Мультиметр': ''}
+SECONDARY = {'F': 1.0, 'dF': 0.1, 'Pmin': 10.0, 'Pmax': 20.0, 'dP1': 1.0, 'dP2': 1.0}
+POINTS = [
+    [2.25, 10.0, 0.0, -40.0, 0.5, -41.0],
+    [2.25, 10.5, 0.5, -39.0, 1.0, -40.0],
+    [3.0, 10.0, -1.0, -45.0, -0.5, None],
+]
+
+
+@pytest.fixture
+def storage():
+    storage = ResultStorage(':memory:')
+    yield storage
+    storage.close()
+
+
+def test_oip3():
+    assert oip3(0.0, -40.0) == 20.0
+    assert oip3(None, -40.0) is None
+
+
+def test_add_run(storage):
+    run_id = storage.add_run('1324УВ11У', '001', IDNS, SECONDARY, POINTS, passed=True,
+                             timestamp=datetime.datetime(2026, 10, 1, 12))
+    [run] = storage.runs()
+    assert run['id'] == run_id
+    assert run['serial'] == '001'
+    assert run['idns'] == IDNS
+    assert run['secondary'] == SECONDARY
+    assert run['passed'] is True
+    assert run['aborted'] is False
+    assert run['points'] == 3
+
+
+def test_points_keep_worst_tone(storage):
+    storage.add_run('1324УВ11У', '001', IDNS, SECONDARY, POINTS, timestamp=datetime.datetime(2026, 10, 1, 12))
+    assert storage.points(2.25) == [
+        ('001', '2026-10-01T12:00:00', 10.0, 20.0),
+        ('001', '2026-10-01T12:00:00', 10.5, 20.25),
+    ]
+    assert storage.points(3.0) == [('001', '2026-10-01T12:00:00', 10.0, 21.0)]
+    assert storage.points(3.0, column='im3_high') == [('001', '2026-10-01T12:00:00', 10.0, None)]
+    with pytest.raises(ValueError):
+        storage.points(3.0, column='serial')
+
+
+def test_oip3_at_frequency_for_device_this_month(storage):
+    storage.add_run('1324УВ11У', '001', IDNS, SECONDARY, POINTS, timestamp=datetime.datetime(2026, 9, 30, 23))
+    storage.add_run('1324УВ11У', '002', IDNS, SECONDARY, POINTS, timestamp=datetime.datetime(2026, 10, 2, 9))
+    storage.add_run('1324УВ11У', '003', IDNS, SECONDARY, POINTS, timestamp=datetime.datetime(2026, 10, 15, 9))
+    storage.add_run('1324УВ12У', '004', IDNS, SECONDARY, POINTS, timestamp=datetime.datetime(2026, 10, 15, 9))
+
+    rows = storage.points(2.25, device='1324УВ11У',
+                          since=datetime.datetime(2026, 10, 1), until=datetime.datetime(2026, 11, 1))
+    assert [(serial, pow, level) for serial, _, pow, level in rows] == [
+        ('002', 10.0, 20.0), ('002', 10.5, 20.25), ('003', 10.0, 20.0), ('003', 10.5, 20.25),
+    ]
+
+
+def test_run_filters(storage):
+    other = dict(SECONDARY, dF=0.05, dP2=2.0)
+    storage.add_run('1324УВ11У', '001', IDNS, SECONDARY, POINTS, passed=True)
+    storage.add_run('1324УВ11У', '002', {'Анализатор': 'Keysight,N9030B,2'}, other, POINTS, passed=False)
+
+    assert [r['serial'] for r in storage.runs(idn='Agilent,N9030A,1')] == ['001']
+    assert [r['serial'] for r in storage.runs(idn='Keysight,N9030B,2')] == ['002']
+    assert [r['serial'] for r in storage.runs(passed=False)] == ['002']
+    assert [r['serial'] for r in storage.runs(dF=0.1, dP1=1.0)] == ['001']
+    assert [r['serial'] for r in storage.runs(dP1=1.0)] == ['001', '002']
+    assert {row[0] for row in storage.points(2.25, dF=0.05)} == {'002'}
+    assert storage.runs(idn='') == []
+    with pytest.raises(ValueError):
+        storage.runs(Pmin=10.0)
+
+
+def test_migrates_first_release_database(tmp_path):
+    path = str(tmp_path / 'results.db')
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE run (id INTEGER PRIMARY KEY, device TEXT NOT NULL, serial TEXT NOT NULL,
+                          timestamp TEXT NOT NULL, idns TEXT NOT NULL, secondary TEXT NOT NULL);
+        CREATE TABLE point (run_id INTEGER NOT NULL, freq REAL NOT NULL, pow REAL NOT NULL, tone1 REAL,
+                            im3_low REAL, tone2 REAL, im3_high REAL, oip3 REAL);
+    ''')
+    conn.execute('INSERT INTO run (device, serial, timestamp, idns, secondary) VALUES (?, ?, ?, ?, ?)',
+                 ('1324УВ11У', '001', '2026-10-01T12:00:00', json.dumps(IDNS), json.dumps(SECONDARY)))
+    conn.commit()
+    conn.close()
+
+    storage = ResultStorage(path)
+    [run] = storage.runs(idn='Agilent,N9030A,1', dF=0.1)
+    assert run['serial'] == '001'
+    assert run['passed'] is None
+    storage.add_run('1324УВ11У', '002', IDNS, SECONDARY, POINTS, passed=True)
+    assert [r['serial'] for r in storage.runs(passed=True)] == ['002']
+    storage.close()
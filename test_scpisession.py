@@ -0,0 +1,76 @@
+import pytest
+
+from scpisession import ReplayError, SessionLog
+
+
+class FakeAnalyzer:
+    # answers depend on the instrument state, like a marker read on a real analyzer
+    def __init__(self):
+        self.center = None
+        self.count = 0
+
+    def write(self, command):
+        if command.startswith(':SENS:FREQ:CENT '):
+            self.center = float(command.split()[1])
+        return len(command)
+
+    def query(self, question):
+        self.count += 1
+        if question == '*IDN?':
+            return 'Agilent,N9030A,1,1'
+        if question == '*ESR?':
+            return str(int(self.count % 3 == 0))
+        return f'{-self.center * 10:.1f}'
+
+
+def sweep(inst, centers):
+    levels = list()
+    for center in centers:
+        inst.write(f':SENS:FREQ:CENT {center}')
+        inst.write(':INIT:IMM')
+        while not int(inst.query('*ESR?')) & 1:
+            pass
+        levels.append(inst.query(':CALC:MARK1:Y?'))
+    return levels
+
+
+@pytest.fixture
+def recorded(tmp_path):
+    log = SessionLog()
+    inst = log.record('GPIB0::18::INSTR', FakeAnalyzer())
+    inst.query('*IDN?')
+    log.result = sweep(inst, [1.0, 0.9, 1.1, 1.2])
+    path = tmp_path / 'session.scpi.gz'
+    log.save(path)
+    return SessionLog.load(path)
+
+
+def test_roundtrip_identical(recorded):
+    inst = recorded.replay('GPIB0::18::INSTR', time_scale=0)
+    assert inst.query('*IDN?') == 'Agilent,N9030A,1,1'
+    assert sweep(inst, [1.0, 0.9, 1.1, 1.2]) == recorded.result
+
+
+def test_reordered_reads_get_answers_for_their_state(recorded):
+    inst = recorded.replay('GPIB0::18::INSTR', time_scale=0)
+    assert sweep(inst, [1.2, 1.1, 1.0, 0.9]) == ['-12.0', '-11.0', '-10.0', '-9.0']
+
+
+def test_redundant_write_dropped(recorded):
+    inst = recorded.replay('GPIB0::18::INSTR', time_scale=0)
+    inst.write(':SENS:FREQ:CENT 0.9')
+    assert inst.query(':CALC:MARK1:Y?') == '-9.0'
+    assert inst.query(':CALC:MARK1:Y?') == '-9.0'
+
+
+def test_unrecorded_state_is_a_desync(recorded):
+    inst = recorded.replay('GPIB0::18::INSTR', time_scale=0)
+    inst.write(':SENS:FREQ:CENT 2.0')
+    with pytest.raises(ReplayError, match='desync'):
+        inst.query(':CALC:MARK1:Y?')
+
+
+def test_reset_keeps_identification(recorded):
+    recorded.reset()
+    assert [e[2] for e in recorded.entries] == ['*IDN?']
+    assert recorded.result is None
@@ -0,0 +1,97 @@
+import pytest
+
+from sweepspec import SweepSpecError, _grid, compile_plan, validate, validate_params
+
+
+SECONDARY = {'F': 1.0, 'dF': 0.1, 'Pmin': 10.0, 'Pmax': 11.0, 'dP1': 1.0, 'dP2': 0.5}
+
+
+def device(**sweep):
+    return {'F': [1.15, 2.25], 'P1': 15, 'sweep': sweep}
+
+
+def test_grid_list():
+    assert _grid('F', [1, 2.5]) == [1.0, 2.5]
+
+
+def test_grid_range_includes_stop():
+    assert _grid('F', {'start': 1, 'stop': 2, 'step': 0.1}) == [1.0, 1.1, 1.2, 1.3, 1.4, 1.5, 1.6, 1.7, 1.8, 1.9, 2.0]
+
+
+def test_grid_range_does_not_pass_stop():
+    assert _grid('F', {'start': 1, 'stop': 1.05, 'step': 0.1}) == [1.0]
+
+
+@pytest.mark.parametrize('value', [[], {'start': 1, 'stop': 2}, {'start': 2, 'stop': 1, 'step': 0.1},
+                                   {'start': 1, 'stop': 2, 'step': 0}, 'x', [1, 'x'], [True]])
+def test_grid_rejects(value):
+    with pytest.raises(SweepSpecError):
+        _grid('F', value)
+
+
+def test_validate_defaults_to_device_freqs():
+    spec = validate({'F': [1.15, 2.25], 'P1': 15})
+    assert spec['F'] == [1.15, 2.25]
+    assert spec['offsets'] == [0, -1, 1, 2]
+    assert spec['marker'] == 1
+
+
+@pytest.mark.parametrize('sweep', [
+    {'unknown': 1},
+    {'offsets': [0, -1, 1, 2, -2, 3]},
+    {'marker': 1.7},
+    {'averages': 2.5},
+    {'rbw': 'fast'},
+    {'span': 0},
+])
+def test_validate_rejects(sweep):
+    with pytest.raises(SweepSpecError):
+        validate(device(**sweep))
+
+
+def test_validate_rejects_non_dict_sweep():
+    with pytest.raises(SweepSpecError):
+        validate({'F': [1.0], 'P1': 15, 'sweep': [1, 2]})
+
+
+def test_validate_params_names_device():
+    with pytest.raises(SweepSpecError, match='bad'):
+        validate_params({'bad': device(marker=0)})
+
+
+def test_compile_plan_grid():
+    param = device()
+    param['sweep'] = validate(param)
+    plan = compile_plan(param, SECONDARY)
+
+    assert len(plan.steps) == 2 * 3
+    first = plan.steps[0]
+    assert (first.freq, first.pow, first.pow1, first.pow2) == (1.15, 10.0, 11.0, 10.5)
+    assert first.analyzer_freqs == (1.15, 1.05, 1.25, 1.35)
+    assert [s.pow for s in plan.steps[:2]] == [10.0, 10.5]
+
+
+@pytest.mark.parametrize('pmin, pmax, step, count, last', [
+    (10.0, 20.0, 0.5, 21, 20.0),
+    (10.0, 11.0, 0.1, 11, 11.0),
+    (10.0, 10.75, 0.5, 2, 10.5),
+])
+def test_compile_plan_default_pows_within_operator_range(pmin, pmax, step, count, last):
+    param = device(Pstep=step)
+    param['sweep'] = validate(param)
+    plan = compile_plan(param, dict(SECONDARY, Pmin=pmin, Pmax=pmax))
+
+    pows = [s.pow for s in plan.steps if s.freq == 1.15]
+    assert len(pows) == count
+    assert pows[0] == pmin
+    assert pows[-1] == last
+    assert max(pows) <= pmax
+
+
+def test_compile_plan_explicit_pows_and_cache():
+    param = device(P=[0, 5])
+    param['sweep'] = validate(param)
+    plan = compile_plan(param, SECONDARY)
+
+    assert [s.pow for s in plan.steps] == [0.0, 5.0, 0.0, 5.0]
+    assert compile_plan(param, dict(SECONDARY)) is plan
@@ -0,0 +1,8 @@
+def load_ui(widget, form, filename):
+    # form is the class precompiled by install.py, None when running from sources without a build
+    if form is None:
+        from PyQt5 import uic
+        return uic.loadUi(filename, widget)
+    ui = form()
+    ui.setupUi(widget)
+    return ui